@@ -26,9 +26,14 @@ def add_source_column(input_path: str, output_path: str, column_name: str, sourc
     
     # --- 2️⃣ Load CSV into a Pandas DataFrame ---
     try:
+        # C engine on purpose: the pyarrow engine applies dtype AFTER Arrow's
+        # own inference, so numeric-looking IDs get parsed as int and lose
+        # their leading zeros before the string cast. The C parser honors the
+        # dtype up front and still hands back Arrow-backed columns.
         df = pd.read_csv(
-            input_path, 
-            dtype={'PatientID': str},  # Ensure PatientID is treated as string
+            input_path,
+            dtype_backend='pyarrow',
+            dtype={'PatientID': 'string[pyarrow]'},  # Ensure PatientID is treated as string
             keep_default_na=False      # Prevent Pandas from automatically converting blanks to NaN
         )
     except Exception as e:
@@ -1,20 +1,23 @@
 import pandas as pd  # Import Pandas for data manipulation
+import numpy as np   # Import NumPy for vectorized condition evaluation
 import os            # Import os for file path checking
 
 # --- Configuration ---
-# Path to  already created combined long-format CSV file
-INPUT_CSV_PATH = "/home/ec2-user/2025-09-19_Full Cohort September/2025-09-19_Full Cohort September/SPARC_Full_Cohort_Long_Format_COMBINED_CLEANED_VARS.csv"
+# Path to  already created combined long-format parquet file
+INPUT_PARQUET_PATH = "/home/ec2-user/2025-09-19_Full Cohort September/2025-09-19_Full Cohort September/SPARC_Full_Cohort_Long_Format_COMBINED_CLEANED_VARS.parquet"
 KEY_COLUMN = 'DEIDENTIFIED_MASTER_PATIENT_ID'  # Column identifying unique patients
 
 # --- Output Files ---
-OUTPUT_PATIENTS_CSV = "Patient_Identifiers_Final.csv"      # CSV for Patients table
-OUTPUT_FIELD_DEFS_CSV = "Field_Definitions_Final.csv"     # CSV for Field Definitions table
-OUTPUT_FIELD_VALUES_CSV = "Field_Values_Final.csv"        # CSV for Field Values table (renamed input)
+# Intermediate tables consumed by the compliance stage are parquet; only the
+# Patients table stays CSV since nothing downstream re-parses it
+OUTPUT_PATIENTS_CSV = "Patient_Identifiers_Final.csv"           # CSV for Patients table
+OUTPUT_FIELD_DEFS_PARQUET = "Field_Definitions_Final.parquet"   # Parquet for Field Definitions table
+OUTPUT_FIELD_VALUES_PARQUET = "Field_Values_Final.parquet"      # Parquet for Field Values table (renamed input)
 
 # --- Function Definition ---
 def generate_database_tables(input_path: str):
     """
-    Loads the long-format CSV and extracts data to populate:
+    Loads the long-format parquet and extracts data to populate:
     1. Patients table
     2. Field Definitions table (with inferred types)
     3. Field Values table
@@ -28,14 +31,12 @@ def generate_database_tables(input_path: str):
 
     print("Loading combined long-format data...")
     try:
-        # Load CSV
-        combined_df = pd.read_csv(
-            input_path, 
-            dtype={KEY_COLUMN: str},    # Ensure patient IDs are read as strings
-            keep_default_na=False       # Keep empty strings as-is, don't convert to NaN
-        )
+        # Load parquet with Arrow-backed dtypes: no CSV re-parsing, column
+        # types survive from the previous stage, and string ops dispatch to
+        # vectorized Arrow kernels.
+        combined_df = pd.read_parquet(input_path, dtype_backend='pyarrow')
     except Exception as e:
-        print(f"Error reading combined CSV: {e}")
+        print(f"Error reading combined parquet: {e}")
         return
 
     # --- 1. Extract Patients Table ---
@@ -51,47 +52,59 @@ def generate_database_tables(input_path: str):
     # a. Get all unique variable names
     field_definitions_df = combined_df[['Variable']].drop_duplicates().reset_index(drop=True)
 
-    # b. Function to infer data type, considering missing values
-    def infer_data_type(series):
-        """
-        Infers the type of a variable.
-        Returns: 'integer', 'float', 'date', or 'string'
-        Ignores NA/missing values when computing percentages.
-        """
-        series = series.dropna()  # Remove NA values before type inference
-        
-        if len(series) == 0:     # If all values are NA, treat as string
-            return 'string'
-        
-        # Attempt numeric conversion
-        numeric_series = pd.to_numeric(series, errors='coerce')  # Coerce non-numeric to NaN
-        numeric_count = numeric_series.notna().sum()             # Count of numeric values
-        
-        # If >=80% of non-NA values are numeric
-        if numeric_count / len(series) > 0.8:
-            # If >=95% of numeric values are integers
-            if ((numeric_series % 1 == 0).sum() / numeric_count) > 0.95:
-                return 'integer'
-            return 'float'  # Otherwise, float
-        
-        # Check if all remaining values look like dates (YYYY-MM-DD)
-        if series.str.match(r'^\d{4}-\d{2}-\d{2}$').all():
-            return 'date'
-        
-        # Default fallback
-        return 'string'
-
-    # c. Apply type inference for each variable
-    type_df = combined_df.groupby('Variable')['Value'].apply(
-        lambda x: infer_data_type(x.astype(str))  # Convert values to string before inference
-    ).reset_index(name='Data_Type')
+    # b. Vectorized type inference: parse the whole Value column once, then
+    #    aggregate parse results per Variable in a single groupby pass.
+    #    Replaces a Python UDF per group that re-ran pd.to_numeric and the
+    #    date regex on every group's values.
+    values_str = combined_df['Value'].astype('string[pyarrow]')
+    numeric_values = pd.to_numeric(values_str, errors='coerce')
+    is_numeric = numeric_values.notna()
+    is_integer = is_numeric & (numeric_values % 1 == 0)
+    # Fixed-format to_datetime uses pandas' C parser (~10x the generic path)
+    # and, unlike the old shape regex, rejects impossible dates like 9999-99-99
+    is_date = pd.to_datetime(values_str, format='%Y-%m-%d', errors='coerce').notna()
+
+    # Factorize the variable names first: the groupby then hashes small int
+    # codes instead of millions of Python strings, and the codes are mapped
+    # back to names once on the (small) aggregated result
+    variable_codes, unique_variables = pd.factorize(combined_df['Variable'])
+
+    grouped = pd.DataFrame({
+        '_vcode': variable_codes,
+        'n_numeric': is_numeric,
+        'n_integer': is_integer,
+        'n_date': is_date,
+    }).groupby('_vcode', sort=False)
+
+    counts = grouped.sum()
+    counts['n'] = grouped.size()
+    counts.index = pd.Index(unique_variables[counts.index], name='Variable')
+
+    # c. Derive types with the same thresholds as before:
+    #    >80% numeric -> integer if >95% of numerics are whole, else float;
+    #    all values date-shaped -> date; otherwise string.
+    numeric_ratio = counts['n_numeric'] / counts['n']
+    integer_ratio = counts['n_integer'] / counts['n_numeric']  # NaN when no numerics
+
+    counts['Data_Type'] = np.select(
+        [
+            (numeric_ratio > 0.8) & (integer_ratio > 0.95),
+            numeric_ratio > 0.8,
+            counts['n_date'] == counts['n'],
+        ],
+        ['integer', 'float', 'date'],
+        default='string'
+    )
+    type_df = counts[['Data_Type']].reset_index()
 
     # d. Merge inferred types into field definitions
     field_definitions_df = field_definitions_df.merge(type_df, on='Variable', how='left')
     field_definitions_df.rename(columns={'Variable': 'FieldName'}, inplace=True)      # Rename column
     field_definitions_df['Description'] = field_definitions_df['FieldName']          # Placeholder description
-    field_definitions_df.to_csv(OUTPUT_FIELD_DEFS_CSV, index=False)                  # Save to CSV
-    print(f"Field Definitions saved to {OUTPUT_FIELD_DEFS_CSV} ({len(field_definitions_df)} fields).")
+    field_definitions_df.to_parquet(
+        OUTPUT_FIELD_DEFS_PARQUET, engine='pyarrow', compression='zstd', index=False
+    )
+    print(f"Field Definitions saved to {OUTPUT_FIELD_DEFS_PARQUET} ({len(field_definitions_df)} fields).")
 
     # --- 3. Prepare Field Values Table ---
     print("\nExtraction 3/3: Preparing Field Values table...")
@@ -100,9 +113,11 @@ def generate_database_tables(input_path: str):
         'Variable': 'FieldName',  # Rename variable column
         'Value': 'FieldValue'     # Rename value column
     })
-    field_values_df.to_csv(OUTPUT_FIELD_VALUES_CSV, index=False)  # Save to CSV
-    print(f"Field Values saved to {OUTPUT_FIELD_VALUES_CSV} ({len(field_values_df)} records).")
+    field_values_df.to_parquet(
+        OUTPUT_FIELD_VALUES_PARQUET, engine='pyarrow', compression='zstd', index=False
+    )
+    print(f"Field Values saved to {OUTPUT_FIELD_VALUES_PARQUET} ({len(field_values_df)} records).")
 
 # --- Execute ---
-generate_database_tables(INPUT_CSV_PATH)
+generate_database_tables(INPUT_PARQUET_PATH)
 
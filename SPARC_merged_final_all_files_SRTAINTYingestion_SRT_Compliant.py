@@ -4,7 +4,8 @@ import os                 # For checking file existence
 import re                 # For regular expressions (used to sanitize field names)
 
 # --- Configuration ---
-INPUT_CSV_PATH = "Field_Values_Final.csv"  # Input CSV containing patient field values
+INPUT_PARQUET_PATH = "Field_Values_Final.parquet"  # Input parquet containing patient field values
+INPUT_FIELD_DEFS_PARQUET = "Field_Definitions_Final.parquet"  # Input parquet containing field definitions
 OUTPUT_FIELD_VALUES_COMPLIANT_CSV = "Field_Values_SRT_Compliant.csv"  # Output compliant Field Values table
 OUTPUT_FIELD_DEFS_COMPLIANT_CSV = "Field_Definitions_SRT_Compliant.csv"  # Output compliant Field Definitions table
 OUTPUT_PATIENTS_CSV = "Patient_Identifiers_Final.csv"  # Output patient identifiers table
@@ -18,6 +19,10 @@ SRT_FIELD_TYPES = {
     'boolean': 'boolean'  # Boolean remains boolean
 }
 
+# Characters not allowed in a compliant field name (compiled once, shared by
+# the scalar and the column-wise sanitizers)
+INVALID_FIELD_NAME_CHARS = re.compile(r'[^a-z0-9_]+')
+
 def sanitize_field_name(name: str) -> str:
     """
     Sanitizes field names for database compliance.
@@ -26,9 +31,18 @@ def sanitize_field_name(name: str) -> str:
     - Strips leading and trailing underscores
     Example: 'Blood Pressure(mmHg)' -> 'blood_pressure_mmhg'
     """
-    sanitized = re.sub(r'[^a-z0-9_]+', '_', name.lower())  # Replace invalid chars with '_'
+    sanitized = INVALID_FIELD_NAME_CHARS.sub('_', name.lower())  # Replace invalid chars with '_'
     return sanitized.strip('_')  # Remove leading/trailing underscores
 
+def sanitize_field_name_column(names: pd.Series) -> pd.Series:
+    """
+    Column-wise version of sanitize_field_name. Sanitizes only the unique
+    names (typically a few thousand) and broadcasts the result back over the
+    column with a vectorized .map, so the regex runs U times instead of N.
+    """
+    mapping = {name: sanitize_field_name(name) for name in names.unique()}
+    return names.map(mapping)
+
 def create_srt_compliant_files(input_path: str):
     """
     Main function to create SRT-compliant tables:
@@ -43,17 +57,14 @@ def create_srt_compliant_files(input_path: str):
         return
 
     print("Loading Field Values data for compliance checks...")
-    
+
     try:
-        # Load Field Values CSV
-        df = pd.read_csv(
-            input_path, 
-            dtype={'PatientID': str},  # Ensure PatientID is treated as string
-            na_values=['NA', 'N/A', '', ' '],  # Treat these as NaN
-            keep_default_na=True  # Include default NaN values
-        )
+        # Load Field Values parquet with Arrow-backed dtypes so the heavy
+        # string columns stay compact and string ops run in Arrow's C++
+        # kernels. No CSV re-parsing between stages.
+        df = pd.read_parquet(input_path, dtype_backend='pyarrow')
     except Exception as e:
-        print(f"Error reading Field Values CSV: {e}")
+        print(f"Error reading Field Values parquet: {e}")
         return
 
     # --- 1️⃣ Extract Patient Identifiers ---
@@ -66,14 +77,22 @@ def create_srt_compliant_files(input_path: str):
     print("\nCleaning Field Values: Filtering out implicit/explicit nulls...")
     initial_count = len(df)  # Save original number of rows
 
-    # Drop rows where FieldValue is NaN (explicit or implicit nulls)
-    df_filtered = df.dropna(subset=['FieldValue'])
+    # One boolean mask drops true nulls, values that strip down to an empty
+    # string, and the literal null markers ('NA'/'N/A') that the CSV reader
+    # used to coerce via na_values before the parquet handoff
+    field_value_strings = df['FieldValue'].astype('string[pyarrow]').str.strip()
+    df_filtered = df[
+        field_value_strings.notna()
+        & (field_value_strings.str.len() > 0)
+        & ~field_value_strings.isin(['NA', 'N/A'])
+    ].assign(
+        # Sanitize FieldName for database compliance (vectorized over the
+        # column); .assign avoids the .loc write onto a filtered slice
+        FieldName_Sanitized=lambda x: sanitize_field_name_column(x['FieldName'])
+    )
     rows_removed = initial_count - len(df_filtered)  # Count how many rows removed
     print(f"   - Removed {rows_removed} null/NA rows. New size: {len(df_filtered)}")
 
-    # Sanitize FieldName for database compliance
-    df_filtered.loc[:, 'FieldName_Sanitized'] = df_filtered['FieldName'].apply(sanitize_field_name)
-
     # Prepare final Field Values table for SRT
     field_values_final = df_filtered[['PatientID', 'FieldName_Sanitized', 'FieldValue']].copy()
     field_values_final.rename(columns={'FieldName_Sanitized': 'FieldName'}, inplace=True)  # Rename sanitized column
@@ -83,21 +102,20 @@ def create_srt_compliant_files(input_path: str):
     # --- 3️⃣ Create Compliant Field Definitions ---
     print("\nCreating Compliant Field Definitions (Sanitized Names & Mapped Types)...")
 
-    # Load original Field Definitions CSV
-    if not os.path.exists("Field_Definitions_Final.csv"):
-        print("Cannot find 'Field_Definitions_Final.csv'. Skipping Field Definitions creation.")
+    # Load original Field Definitions parquet
+    if not os.path.exists(INPUT_FIELD_DEFS_PARQUET):
+        print(f"Cannot find '{INPUT_FIELD_DEFS_PARQUET}'. Skipping Field Definitions creation.")
         return
 
-    defs_df = pd.read_csv("Field_Definitions_Final.csv")
-
-    # Sanitize FieldName column
-    defs_df['FieldName_Sanitized'] = defs_df['FieldName'].apply(sanitize_field_name)
+    defs_df = pd.read_parquet(INPUT_FIELD_DEFS_PARQUET, dtype_backend='pyarrow')
 
-    # Map original Data_Type to SRT-compliant types
-    defs_df['Data_Type_Mapped'] = defs_df['Data_Type'].map(SRT_FIELD_TYPES)
+    # Sanitize FieldName column (vectorized over the column)
+    defs_df['FieldName_Sanitized'] = sanitize_field_name_column(defs_df['FieldName'])
 
-    # If mapping failed (type not recognized), default to string
-    defs_df.loc[defs_df['Data_Type_Mapped'].isna(), 'Data_Type_Mapped'] = 'string'
+    # Map original Data_Type to SRT-compliant types; unrecognized types fall
+    # back to string via a single vectorized fillna instead of a boolean-mask
+    # .loc assignment
+    defs_df['Data_Type_Mapped'] = defs_df['Data_Type'].map(SRT_FIELD_TYPES).fillna('string')
 
     # Finalize Field Definitions table for SRT
     field_defs_final = defs_df[['FieldName_Sanitized', 'Data_Type_Mapped', 'Description']].copy()
@@ -109,5 +127,5 @@ def create_srt_compliant_files(input_path: str):
     print(f"Field Definitions (Compliant) saved to {OUTPUT_FIELD_DEFS_COMPLIANT_CSV}.")
 
 # --- EXECUTION ---
-create_srt_compliant_files(INPUT_CSV_PATH)  # Run the function
+create_srt_compliant_files(INPUT_PARQUET_PATH)  # Run the function
 
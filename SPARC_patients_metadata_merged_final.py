@@ -1,19 +1,157 @@
 import pandas as pd
-from typing import List, Dict
+import numpy as np
+import duckdb
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
 import os
 import time
 
-def process_excel_to_single_long_dataframe(file_path: str, sheets_to_process: List[str]) -> pd.DataFrame:
+KEY_COLUMN = 'DEIDENTIFIED_MASTER_PATIENT_ID'
+
+def process_sheet(file_path: str, sheet_name: str, staging_dir: str) -> Optional[str]:
     """
-    Reads specified sheets, prefixes all column names with the sheet name,
-    processes the data into a normalized long format including a sequential
-    record number, formats all datetime columns BEFORE melting, and concatenates
-    everything into a single long-format DataFrame.
+    Reads ONE sheet, prefixes its column names with the sheet name, processes
+    the data into a normalized long format including a sequential record
+    number, formats all datetime columns BEFORE reshaping, and writes the
+    sheet's long fragment to parquet in staging_dir.
+
+    Runs in a worker process (sheets are fully independent), so it returns
+    the fragment path rather than a DataFrame. Returns None if the sheet
+    lacks the patient ID column.
+    """
+    print(f"\nProcessing sheet: **{sheet_name}**")
+
+    # -----------------------------------------------
+    # Read just this worker's sheet.
+    # parse_dates=True → Pandas will try to detect any date columns.
+    # dtype → ensure patient ID stays as a string (important for reshaping).
+    # -----------------------------------------------
+    df = pd.read_excel(
+        file_path,
+        sheet_name=sheet_name,
+        parse_dates=True,
+        dtype={KEY_COLUMN: str}
+    )
+
+    # ----------------------------------------------------
+    # Ensure the key patient ID column exists
+    # ----------------------------------------------------
+    if KEY_COLUMN not in df.columns:
+        print(f"Skipping sheet {sheet_name}: Missing '{KEY_COLUMN}'.")
+        return None
+
+    # ----------------------------------------------------
+    # Standardize the column names:
+    # - strip whitespace
+    # - replace spaces with underscores
+    # - uppercase everything
+    # ----------------------------------------------------
+    df.columns = df.columns.str.strip().str.replace(' ', '_').str.upper()
+
+    # ----------------------------------------------------
+    # Prefix all non-ID columns with the sheet name
+    # e.g., column "AGE" in sheet "SUMMARY_ENROLLMENT"
+    # becomes "SUMMARY_ENROLLMENT_AGE"
+    # ----------------------------------------------------
+    prefix = sheet_name.upper().replace(' ', '_') + '_'
+
+    new_columns = {}
+    for col in df.columns:
+        if col != KEY_COLUMN:
+            new_columns[col] = prefix + col
+
+    df.rename(columns=new_columns, inplace=True)
+
+    # ----------------------------------------------------
+    # Remove fully duplicate rows (optional but useful).
+    # hash_pandas_object folds each row to a single uint64 in one
+    # vectorized pass, so the dedup compares one column instead of
+    # hashing every column through the composite-subset path.
+    # ----------------------------------------------------
+    initial_rows = len(df)
+    row_hashes = pd.util.hash_pandas_object(df, index=False)
+    df = df.loc[~row_hashes.duplicated(keep='first')]
+    rows_removed = initial_rows - len(df)
+    print(f"   - Removed {rows_removed} completely duplicate rows.")
+
+    # ----------------------------------------------------
+    # Add RECORD_NUMBER = 1,2,3... per patient ID
+    # cumcount() gives 0,1,2... so add +1
+    # ----------------------------------------------------
+    df.loc[:, 'RECORD_NUMBER'] = df.groupby(KEY_COLUMN).cumcount() + 1
+
+    # ----------------------------------------------------
+    # Identify date columns detected by Pandas
+    # ----------------------------------------------------
+    date_cols = df.select_dtypes(include=['datetime64', 'datetime64[ns]']).columns
+
+    if not date_cols.empty:
+        print(f"   - Formatting {len(date_cols)} date columns to YYYY-MM-DD string format.")
+        # Convert datetime columns to formatted strings BEFORE reshaping
+        for col in date_cols:
+            df[col] = df[col].dt.strftime('%Y-%m-%d').astype(str)
+
+    # ----------------------------------------------------
+    # Prepare for reshaping (long format)
+    # Exclude the patient ID and record number
+    # ----------------------------------------------------
+    value_vars = [col for col in df.columns if col not in [KEY_COLUMN, 'RECORD_NUMBER']]
+
+    # ----------------------------------------------------
+    # Reshape wide -> long directly with NumPy arrays instead of
+    # df.melt: ravel the value block column-major (all rows of the
+    # first variable, then the second, ...) and tile/repeat the id
+    # columns to match. Avoids pandas' block-manager copies in melt.
+    # The value block is cast to the nullable string dtype first so the
+    # long column is uniformly typed for the parquet write (a mixed
+    # float/str object column fails Arrow conversion) while missing
+    # cells stay null instead of becoming 'nan'.
+    # ----------------------------------------------------
+    n_rows = len(df)
+    values = df[value_vars].astype('string').to_numpy().ravel(order='F')
+    patient_ids = np.tile(df[KEY_COLUMN].to_numpy(), len(value_vars))
+    record_numbers = np.tile(
+        df['RECORD_NUMBER'].astype(str).to_numpy(dtype=object),
+        len(value_vars)
+    )
+    variable_names = np.repeat(np.array(value_vars, dtype=object), n_rows)
+
+    # ----------------------------------------------------
+    # Construct final variable name:
+    #   SHEETNAME_COLUMNNAME_RECORDNUMBER
+    # Example:
+    #   SUMMARY_ENROLLMENT_AGE_1
+    # ----------------------------------------------------
+    final_long_df = pd.DataFrame({
+        KEY_COLUMN: patient_ids,
+        'Value': values,
+        'Variable': variable_names + '_' + record_numbers,
+    })
+
+    print(f"   - Resulting normalized long format shape for {sheet_name}: {final_long_df.shape}")
+
+    # ----------------------------------------------------
+    # Persist the sheet's long fragment to parquet
+    # ----------------------------------------------------
+    fragment_path = os.path.join(staging_dir, f"{sheet_name}.parquet")
+    final_long_df.to_parquet(fragment_path, engine='pyarrow', index=False)
+    return fragment_path
+
+def process_excel_to_single_long_dataframe(
+    file_path: str,
+    sheets_to_process: List[str],
+    staging_dir: str = "long_format_parts"
+) -> pd.DataFrame:
+    """
+    Processes every requested sheet in parallel (one worker process per
+    sheet — sheets share no state until the final combine), then combines
+    the per-sheet parquet fragments with DuckDB into a single long-format
+    DataFrame.
     """
 
     print("Starting individual sheet processing...")
     start_time = time.time()
-    
+
     # -----------------------------
     # Check if the Excel file exists
     # -----------------------------
@@ -21,139 +159,46 @@ def process_excel_to_single_long_dataframe(file_path: str, sheets_to_process: Li
         print(f"Error: File not found at path: {file_path}")
         return pd.DataFrame()
 
-    try:
-        # -----------------------------------------------
-        # Read multiple sheets at once.
-        # parse_dates=True → Pandas will try to detect any date columns.
-        # dtype → ensure patient ID stays as a string (important for melting).
-        # -----------------------------------------------
-        all_data: Dict[str, pd.DataFrame] = pd.read_excel(
-            file_path,
-            sheet_name=sheets_to_process,
-            parse_dates=True,
-            dtype={'DEIDENTIFIED_MASTER_PATIENT_ID': str}
-        )
-    except Exception as e:
-        print(f"Error reading Excel file: {e}")
-        return pd.DataFrame()
+    # Parquet fragments (one per sheet) are cheap to write and let DuckDB do
+    # the final concatenation in parallel instead of a pandas concat.
+    os.makedirs(staging_dir, exist_ok=True)
 
-    all_long_dfs: List[pd.DataFrame] = []
-    key_column = 'DEIDENTIFIED_MASTER_PATIENT_ID'
-    
     # ======================================================
-    # Loop through each sheet in the Excel file
+    # Fan the sheets out across worker processes; each reads
+    # and reshapes its own sheet and writes a fragment.
     # ======================================================
-    for sheet_name, df in all_data.items():
-        print(f"\nProcessing sheet: **{sheet_name}**")
-            
-        # ----------------------------------------------------
-        # Ensure the key patient ID column exists
-        # ----------------------------------------------------
-        if key_column not in df.columns:
-            print(f"Skipping sheet {sheet_name}: Missing '{key_column}'.")
-            continue
-            
-        df = df.copy() 
-        
-        # ----------------------------------------------------
-        # Standardize the column names:
-        # - strip whitespace
-        # - replace spaces with underscores
-        # - uppercase everything
-        # ----------------------------------------------------
-        df.columns = df.columns.str.strip().str.replace(' ', '_').str.upper()
-        
-        # ----------------------------------------------------
-        # Prefix all non-ID columns with the sheet name 
-        # e.g., column "AGE" in sheet "SUMMARY_ENROLLMENT"
-        # becomes "SUMMARY_ENROLLMENT_AGE"
-        # ----------------------------------------------------
-        prefix = sheet_name.upper().replace(' ', '_') + '_'
-        
-        new_columns = {}
-        for col in df.columns:
-            if col != key_column:
-                new_columns[col] = prefix + col
-        
-        df.rename(columns=new_columns, inplace=True)
-            
-        # ----------------------------------------------------
-        # Remove fully duplicate rows (optional but useful)
-        # ----------------------------------------------------
-        initial_rows = len(df)
-        df = df.drop_duplicates(subset=df.columns, keep='first')
-        rows_removed = initial_rows - len(df)
-        print(f"   - Removed {rows_removed} completely duplicate rows.")
-
-        # ----------------------------------------------------
-        # Add RECORD_NUMBER = 1,2,3... per patient ID
-        # cumcount() gives 0,1,2... so add +1
-        # ----------------------------------------------------
-        df.loc[:, 'RECORD_NUMBER'] = df.groupby(key_column).cumcount() + 1
-            
-        # ----------------------------------------------------
-        # Identify date columns detected by Pandas
-        # ----------------------------------------------------
-        date_cols = df.select_dtypes(include=['datetime64', 'datetime64[ns]']).columns
-        
-        if not date_cols.empty:
-            print(f"   - Formatting {len(date_cols)} date columns to YYYY-MM-DD string format.")
-            # Convert datetime columns to formatted strings BEFORE melting
-            for col in date_cols:
-                df[col] = df[col].dt.strftime('%Y-%m-%d').astype(str) 
-
-        # ----------------------------------------------------
-        # Prepare for melting (long format)
-        # Exclude the patient ID and record number
-        # ----------------------------------------------------
-        value_vars = [col for col in df.columns if col not in [key_column, 'RECORD_NUMBER']]
-
-        # ----------------------------------------------------
-        # Melt the sheet into three columns:
-        # PatientID | RECORD_NUMBER | Variable | Value
-        # ----------------------------------------------------
-        long_df = df.melt(
-            id_vars=[key_column, 'RECORD_NUMBER'],
-            value_vars=value_vars,
-            var_name='Original_Variable',
-            value_name='Value'
-        )
-                
-        # ----------------------------------------------------
-        # Construct final variable name:
-        #   SHEETNAME_COLUMNNAME_RECORDNUMBER
-        # Example:
-        #   SUMMARY_ENROLLMENT_AGE_1
-        # ----------------------------------------------------
-        long_df['Final_Variable'] = (
-            long_df['Original_Variable'] + '_' +
-            long_df['RECORD_NUMBER'].astype(str)
-        )
-            
-        # ----------------------------------------------------
-        # Drop intermediate columns and rename for final output
-        # ----------------------------------------------------
-        final_long_df = long_df.drop(columns=['Original_Variable', 'RECORD_NUMBER'])
-        final_long_df.rename(columns={'Final_Variable': 'Variable'}, inplace=True)
-            
-        print(f"   - Resulting normalized long format shape for {sheet_name}: {final_long_df.shape}")
-            
-        all_long_dfs.append(final_long_df)
+    fragment_paths: List[str] = []
+    try:
+        with ProcessPoolExecutor(max_workers=len(sheets_to_process)) as executor:
+            futures = [
+                executor.submit(process_sheet, file_path, sheet_name, staging_dir)
+                for sheet_name in sheets_to_process
+            ]
+            fragment_paths = [f.result() for f in futures if f.result() is not None]
+    except Exception as e:
+        print(f"Error processing Excel sheets: {e}")
+        return pd.DataFrame()
 
     # ======================================================
-    # Concatenate all transformed sheets together
+    # Combine all fragments with DuckDB (multi-threaded scan,
+    # zero-copy hand-back to pandas via Arrow). Only the fragments
+    # written by this run are scanned, so stale files left in the
+    # staging directory by a previous run can't leak into the output.
     # ======================================================
-    if not all_long_dfs:
+    if not fragment_paths:
         print("\n No dataframes were successfully processed.")
         return pd.DataFrame()
-        
-    final_combined_df = pd.concat(all_long_dfs, ignore_index=True)
-    
+
+    final_combined_df = duckdb.execute(
+        "SELECT * FROM read_parquet(?, union_by_name=true)",
+        [fragment_paths],
+    ).df()
+
     end_time = time.time()
     print("\n All sheets processed and concatenated into a single DataFrame.")
     print(f"Total processing time: {end_time - start_time:.2f} seconds.")
     print(f"Final Combined DataFrame shape: {final_combined_df.shape}")
-    
+
     return final_combined_df
 
 
@@ -162,26 +207,31 @@ def process_excel_to_single_long_dataframe(file_path: str, sheets_to_process: Li
 # =====================================================================
 
 file_path = "/home/ec2-user/2025-09-19_Full Cohort September/2025-09-19_Full Cohort September/2025-09-19_SPARC_Full Cohort September_REPORTS.xlsx"
-output_csv_path = "/home/ec2-user/2025-09-19_Full Cohort September/2025-09-19_Full Cohort September/SPARC_Full_Cohort_Long_Format_COMBINED_CLEANED_VARS.csv"
+# Intermediate stage output is parquet: far faster to write/read than CSV and
+# it preserves column types for the downstream table-generation stage
+output_parquet_path = "/home/ec2-user/2025-09-19_Full Cohort September/2025-09-19_Full Cohort September/SPARC_Full_Cohort_Long_Format_COMBINED_CLEANED_VARS.parquet"
 
 sheets_to_process = [
     'SUMMARY_ENROLLMENT', 'SUMMARY_OMICS', 'SUMMARY_ENDOSCOPY', 'MEDICATION_OMICS', 'MEDICATION_ENROLLMENT', 'MEDICATION_ENDOSCOPY', 'MED_JOURNEY'
 ]
 
-# Process the Excel file
-final_combined_df = process_excel_to_single_long_dataframe(file_path, sheets_to_process)
+# Guarded so worker processes importing this module don't re-run the pipeline
+if __name__ == "__main__":
+    # Process the Excel file
+    final_combined_df = process_excel_to_single_long_dataframe(file_path, sheets_to_process)
 
-# Save final combined CSV
-if not final_combined_df.empty:
-    try:
-        print(f"\n Saving final combined DataFrame to CSV: {output_csv_path}")
-        final_combined_df.to_csv(output_csv_path, index=False)
-        print("Save complete.")
-        
-        print("\n--- Final Combined DataFrame Head (Preview) ---")
-        print(final_combined_df.head(10))
-        print(f"\nTotal rows saved to CSV: {len(final_combined_df)}")
-        
-    except Exception as e:
-        print(f"\n An error occurred during saving: {e}")
+    # Save final combined parquet
+    if not final_combined_df.empty:
+        try:
+            print(f"\n Saving final combined DataFrame to parquet: {output_parquet_path}")
+            final_combined_df.to_parquet(
+                output_parquet_path, engine='pyarrow', compression='zstd', index=False
+            )
+            print("Save complete.")
+
+            print("\n--- Final Combined DataFrame Head (Preview) ---")
+            print(final_combined_df.head(10))
+            print(f"\nTotal rows saved to parquet: {len(final_combined_df)}")
 
+        except Exception as e:
+            print(f"\n An error occurred during saving: {e}")
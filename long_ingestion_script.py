@@ -1,10 +1,15 @@
+import io
 import logging
+import duckdb
+import numba
+import numpy as np
 import pandas as pd
+from numba import njit, prange
 from sqlalchemy.orm import Session
 from pandas._typing import DtypeObj
 
 # --- SRT Imports ---
-from srt.db.models import FieldType
+from srt.db.models import FieldType, FieldValue
 from srt.services.factory import ServiceFactory
 from srt.services.schemas.field_definitions import FieldDefinitionCreate
 from srt.services.schemas.field_values import FieldValueCreate
@@ -21,6 +26,8 @@ logger = logging.getLogger(__name__)
 
 # --- Reusable Configuration ---
 DEFAULT_BATCH_SIZE = 5000
+LOG_EVERY_N_BATCHES = 10  # Per-batch progress goes to DEBUG; INFO every N batches
+NULL_MARKERS = ['', 'NA', 'N/A']  # Values treated as null by BOTH ingestion passes
 
 # ----------------------------------------------------------------------
 # --- REUSED SRT UTILITY FUNCTIONS ---
@@ -56,48 +63,111 @@ def get_definitions_from_long_data(
     Infers data types for each unique FieldName in the long-format data, 
     using the values in the specified raw_value_col.
     """
+    stats = get_definition_stats(df, field_name_col, raw_value_col)
+    return get_definitions_from_stats(stats)
+
+def get_definition_stats(
+    df: pd.DataFrame,
+    field_name_col: str,
+    raw_value_col: str
+) -> pd.DataFrame:
+    """
+    Computes per-field parse counts (valid/date/numeric/integer) used for
+    type inference. Parses the raw value column ONCE in vectorized C code,
+    then aggregates the parse results per field with a single groupby pass.
+    """
+    raw_values = df[raw_value_col]
+    group_keys = df[field_name_col]
+
+    # Each parser runs exactly once over the column; every derived mask below
+    # reuses the cached parse results instead of re-touching the raw strings.
+    valid = raw_values.notna()
+    date_ok = pd.to_datetime(raw_values, errors='coerce').notna()
+    numeric_series = pd.to_numeric(raw_values, errors='coerce')
+    numeric_ok = numeric_series.notna()
+    integer_ok = numeric_ok & (numeric_series.fillna(0) % 1 == 0)
+
+    # Factorize the field names to int codes and hand the boolean masks to a
+    # JIT-compiled kernel: one parallel pass over plain int/bool arrays
+    # replaces the pandas groupby dispatch on string keys.
+    codes, unique_names = pd.factorize(group_keys)
+    counts = _aggregate_parse_counts(
+        codes,
+        valid.to_numpy(dtype=np.bool_),
+        date_ok.to_numpy(dtype=np.bool_),
+        numeric_ok.to_numpy(dtype=np.bool_),
+        integer_ok.to_numpy(dtype=np.bool_),
+        len(unique_names),
+        numba.get_num_threads(),
+    )
+    return pd.DataFrame(
+        counts,
+        index=pd.Index(unique_names, name=field_name_col),
+        columns=['n_valid', 'n_date', 'n_numeric', 'n_integer'],
+    )
+
+@njit(cache=True, parallel=True)
+def _aggregate_parse_counts(codes, valid, date_ok, numeric_ok, integer_ok, n_groups, n_chunks):
+    """
+    Sums the four parse masks per field-name code. Each prange chunk fills
+    its own partial count matrix (no shared writes), then the partials are
+    reduced; the whole pass runs GIL-free across cores.
+    """
+    n_rows = codes.shape[0]
+    chunk_size = (n_rows + n_chunks - 1) // n_chunks
+    partials = np.zeros((n_chunks, n_groups, 4), dtype=np.int64)
+
+    for chunk in prange(n_chunks):
+        start = chunk * chunk_size
+        end = min(start + chunk_size, n_rows)
+        for i in range(start, end):
+            group = codes[i]
+            if group < 0:  # NaN field name, dropped by groupby semantics
+                continue
+            if valid[i]:
+                partials[chunk, group, 0] += 1
+            if date_ok[i]:
+                partials[chunk, group, 1] += 1
+            if numeric_ok[i]:
+                partials[chunk, group, 2] += 1
+            if integer_ok[i]:
+                partials[chunk, group, 3] += 1
+
+    return partials.sum(axis=0)
+
+def get_definitions_from_stats(stats: pd.DataFrame) -> list[FieldDefinitionCreate]:
+    """Derives a FieldDefinitionCreate per field from accumulated parse counts."""
     field_defs: list[FieldDefinitionCreate] = []
-    
-    unique_field_names = df[field_name_col].unique()
-    
-    for field_name in unique_field_names:
-        # Get all raw values for this specific field
-        values = df[df[field_name_col] == field_name][raw_value_col].dropna()
-        
-        if values.empty:
+
+    for field_name, row in stats.iterrows():
+        n_valid = row['n_valid']
+
+        if n_valid == 0:
             field_type = FieldType.STRING
-        else:
-            # 1. Date Inference (90% threshold)
-            inferred_series = pd.to_datetime(values, errors='coerce')
-            
-            if inferred_series.notna().sum() > 0.9 * len(values):
-                field_type = FieldType.DATE
+        # 1. Date Inference (90% threshold)
+        elif row['n_date'] > 0.9 * n_valid:
+            field_type = FieldType.DATE
+        # 2. Numeric Inference (90% threshold)
+        elif row['n_numeric'] > 0.9 * n_valid:
+            # All parseable numerics integral -> INT, otherwise FLOAT
+            if row['n_integer'] == row['n_numeric']:
+                field_type = FieldType.INT
             else:
-                # 2. Numeric Inference (90% threshold)
-                inferred_series = pd.to_numeric(values, errors='coerce')
-                if inferred_series.notna().sum() > 0.9 * len(values):
-                    # It's numeric (int or float)
-                    dtype = pd.api.types.infer_dtype(inferred_series.dropna(), skipna=True)
-                    if dtype == 'integer':
-                        field_type = FieldType.INT
-                    elif dtype == 'floating':
-                        field_type = FieldType.FLOAT
-                    else:
-                        field_type = FieldType.STRING
-                else:
-                    # 3. Default to String
-                    field_type = FieldType.STRING
+                field_type = FieldType.FLOAT
+        else:
+            # 3. Default to String
+            field_type = FieldType.STRING
 
         # Note: is_delimited is set to False for simplicity unless determined otherwise
         field_defs.append(
             FieldDefinitionCreate(
                 field_name=field_name,
                 field_type=field_type,
-                is_delimited=False, 
+                is_delimited=False,
                 delimiter=None,
             )
         )
-        
+
     return field_defs
 
 def get_field_values_from_long_data(
@@ -107,26 +177,74 @@ def get_field_values_from_long_data(
     raw_value_col: str
 ) -> list[FieldValueCreate]:
     """
-    Directly maps the long-format DataFrame to FieldValueCreate objects row by row.
+    Directly maps the long-format DataFrame to FieldValueCreate objects.
     """
-    field_values: list[FieldValueCreate] = []
-    
-    # Iterate through the DataFrame row by row for direct mapping
-    for _, row in df.iterrows():
-        raw_value = str(row[raw_value_col])
-        
-        if pd.isna(row[raw_value_col]) or raw_value.strip() == "":
-            continue # Skip null or empty values
-            
-        field_values.append(
-            FieldValueCreate(
-                patient_id=row[patient_id_col],
-                field_name=row[field_name_col],
-                raw_value=raw_value,
-            )
+    return [
+        FieldValueCreate(**record)
+        for record in get_field_value_records(df, patient_id_col, field_name_col, raw_value_col)
+    ]
+
+def get_field_value_records(
+    df: pd.DataFrame,
+    patient_id_col: str,
+    field_name_col: str,
+    raw_value_col: str
+) -> list[dict]:
+    """
+    Maps the long-format DataFrame to plain dict rows matching the
+    field_values table schema. Skips Pydantic validation on the hot path.
+    """
+    clean = get_clean_field_values(df, patient_id_col, field_name_col, raw_value_col)
+    return clean.to_dict('records')
+
+def get_clean_field_values(
+    df: pd.DataFrame,
+    patient_id_col: str,
+    field_name_col: str,
+    raw_value_col: str
+) -> pd.DataFrame:
+    """
+    Filters out null/empty raw values with vectorized operations and renames
+    the columns to the field_values table schema.
+    """
+    # Convert and strip the raw values ONCE as Arrow strings; the mask and
+    # the stored values both reuse that pass, so nulls are never stringified
+    # and nothing is stripped twice.
+    stripped = df[raw_value_col].astype('string[pyarrow]').str.strip()
+    mask = stripped.notna() & (stripped.str.len() > 0)
+
+    clean = df.loc[mask, [patient_id_col, field_name_col]].copy()
+    clean.columns = ['patient_id', 'field_name']
+    clean['raw_value'] = stripped[mask]
+    return clean
+
+def copy_field_values(
+    session: Session,
+    df: pd.DataFrame,
+    patient_id_col: str,
+    field_name_col: str,
+    raw_value_col: str
+) -> int:
+    """
+    Bulk-loads one chunk of field values with PostgreSQL COPY ... FROM STDIN,
+    which bypasses per-row INSERT overhead entirely. Returns the number of
+    rows loaded.
+    """
+    clean = get_clean_field_values(df, patient_id_col, field_name_col, raw_value_col)
+
+    buffer = io.StringIO()
+    clean.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+
+    # Drop down to the raw DB-API connection underneath the ORM session
+    raw_connection = session.connection().connection
+    with raw_connection.cursor() as cursor:
+        cursor.copy_expert(
+            f"COPY {FieldValue.__table__.name} (patient_id, field_name, raw_value) "
+            "FROM STDIN WITH (FORMAT CSV)",
+            buffer,
         )
-        
-    return field_values
+    return len(clean)
 
 def ingest_long_dataframe(
     df: pd.DataFrame,
@@ -141,27 +259,31 @@ def ingest_long_dataframe(
         factory = ServiceFactory(session)
         patient_service = factory.patient_service
         field_def_service = factory.field_definition_service
-        field_value_service = factory.field_value_service
-        
+
         # 1. Ingest Patients
         patients = get_unique_patients(df, patient_id_col)
         logger.info(f"Ingesting {len(patients)} unique patients.")
         patient_service.create_many(patients)
-        
+
         # 2. Ingest Field Definitions (Metadata)
         field_defs = get_definitions_from_long_data(df, field_name_col, raw_value_col)
         logger.info(f"Ingesting {len(field_defs)} unique field definitions.")
         field_def_service.create_many(field_defs)
 
         # 3. Ingest Field Values in Batches
+        # Field values bypass the ORM/Pydantic path entirely: each batch is
+        # streamed into the table with PostgreSQL COPY.
         logger.info("Starting Field Value ingestion in batches...")
-        
-        all_field_values = get_field_values_from_long_data(df, patient_id_col, field_name_col, raw_value_col)
-        
-        for start_idx in range(0, len(all_field_values), batch_size):
-            batch = all_field_values[start_idx : start_idx + batch_size]
-            field_value_service.create_many(batch)
-            logger.info(f"Processed batch up to row {start_idx + len(batch)}.")
+        rows_processed = 0
+
+        for batch_number, start_idx in enumerate(range(0, len(df), batch_size), start=1):
+            chunk = df.iloc[start_idx : start_idx + batch_size]
+            rows_processed += copy_field_values(
+                session, chunk, patient_id_col, field_name_col, raw_value_col
+            )
+            logger.debug(f"Processed batch up to row {rows_processed}.")
+            if batch_number % LOG_EVERY_N_BATCHES == 0:
+                logger.info(f"Processed {batch_number} batches ({rows_processed} rows).")
 
         session.commit()
         logger.info("\n🎉 Full Ingestion SUCCESSFUL.")
@@ -170,3 +292,106 @@ def ingest_long_dataframe(
         session.rollback()
         logger.error(f"Error during long-format ingestion: {e}")
         raise
+
+def ingest_long_csv(
+    csv_path: str,
+    session: Session,
+    patient_id_col: str,
+    field_name_col: str,
+    raw_value_col: str,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> None:
+    """
+    Streaming ETL pipeline for a long-format CSV.
+
+    Reads the file in chunks of batch_size rows twice: a metadata pass that
+    accumulates unique patients and per-field type-inference counts, then a
+    value pass that sends each chunk straight to the field value service.
+    Peak memory stays O(batch_size) instead of O(N), so files larger than
+    RAM can be ingested.
+    """
+    try:
+        factory = ServiceFactory(session)
+        patient_service = factory.patient_service
+        field_def_service = factory.field_definition_service
+
+        # chunksize is not supported by engine='pyarrow', so the chunked reads
+        # stay on the C parser but still get Arrow-backed column dtypes.
+        # The NA markers are pinned to the same list the DuckDB metadata scan
+        # nulls out (pandas' default list is much larger), so both passes
+        # share one notion of null.
+        read_kwargs = {
+            'dtype': {patient_id_col: 'string[pyarrow]'},
+            'dtype_backend': 'pyarrow',
+            'chunksize': batch_size,
+            'keep_default_na': False,
+            'na_values': NULL_MARKERS,
+        }
+
+        # --- Pass 1: Metadata (Patients + Field Definitions) via DuckDB ---
+        # One multi-threaded SQL scan over the CSV replaces the chunked
+        # pandas metadata pass: DISTINCT for the patients, TRY_CAST counts
+        # grouped per field for the type-inference stats. NULL_MARKERS as
+        # nullstr plus NULLIF(TRIM(...)) mirror the value pass exactly (its
+        # read uses the same marker list with keep_default_na=False, and
+        # get_clean_field_values strips and drops empties), so n_valid
+        # counts exactly the values the COPY pass will load.
+        logger.info("Metadata pass: scanning CSV with DuckDB...")
+        connection = duckdb.connect()
+        nullstr = ", ".join(f"'{marker}'" for marker in NULL_MARKERS)
+        csv_source = f"read_csv_auto(?, all_varchar=true, nullstr=[{nullstr}])"
+
+        patient_ids = [
+            row[0] for row in connection.execute(
+                f'SELECT DISTINCT "{patient_id_col}" '
+                f'FROM {csv_source} '
+                f'WHERE "{patient_id_col}" IS NOT NULL',
+                [csv_path],
+            ).fetchall()
+        ]
+        stats = connection.execute(
+            f'WITH cleaned AS ('
+            f'    SELECT "{field_name_col}" AS field_name, '
+            f"           NULLIF(TRIM(\"{raw_value_col}\"), '') AS raw_value "
+            f'    FROM {csv_source} '
+            f') '
+            f'SELECT field_name, '
+            f'       COUNT(raw_value) AS n_valid, '
+            f'       COUNT(TRY_CAST(raw_value AS DATE)) AS n_date, '
+            f'       COUNT(TRY_CAST(raw_value AS DOUBLE)) AS n_numeric, '
+            f'       COUNT(CASE WHEN TRY_CAST(raw_value AS DOUBLE) % 1 = 0 '
+            f'             THEN 1 END) AS n_integer '
+            f'FROM cleaned '
+            f'GROUP BY field_name',
+            [csv_path],
+        ).df().set_index('field_name')
+
+        # 1. Ingest Patients
+        patients = [PatientCreate(id=x) for x in patient_ids]
+        logger.info(f"Ingesting {len(patients)} unique patients.")
+        patient_service.create_many(patients)
+
+        # 2. Ingest Field Definitions (Metadata)
+        field_defs = get_definitions_from_stats(stats)
+        logger.info(f"Ingesting {len(field_defs)} unique field definitions.")
+        field_def_service.create_many(field_defs)
+
+        # --- Pass 2: Field Values, streamed chunk by chunk ---
+        logger.info("Starting streamed Field Value ingestion...")
+        rows_processed = 0
+
+        for batch_number, chunk in enumerate(pd.read_csv(csv_path, **read_kwargs), start=1):
+            rows_processed += copy_field_values(
+                session, chunk, patient_id_col, field_name_col, raw_value_col
+            )
+            logger.debug(f"Processed batch up to row {rows_processed}.")
+            if batch_number % LOG_EVERY_N_BATCHES == 0:
+                logger.info(f"Processed {batch_number} batches ({rows_processed} rows).")
+
+        session.commit()
+        logger.info("\n🎉 Full Ingestion SUCCESSFUL.")
+
+    except Exception as e:
+        session.rollback()
+        logger.error(f"Error during long-format CSV ingestion: {e}")
+        raise
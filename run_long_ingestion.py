@@ -1,9 +1,8 @@
-import pandas as pd
 import os
 import logging
 
 # Assuming the ingestion module is saved as 'long_ingestion_script.py'
-from long_ingestion_script import ingest_long_dataframe 
+from long_ingestion_script import ingest_long_csv
 from srt.db.connection import DBEnvironment, DBRole, init_session, managed_session
 
 logger = logging.getLogger(__name__)
@@ -21,19 +20,21 @@ if __name__ == "__main__":
     logger.info("Starting Long Format Data Ingestion Runner...")
 
     try:
-        # 1. Load Data
-        logger.info(f"Loading data from {DATA_FILE_PATH}...")
-        long_df = pd.read_csv(DATA_FILE_PATH)
+        # 1. Check Data File
+        if not os.path.exists(DATA_FILE_PATH):
+            raise FileNotFoundError(DATA_FILE_PATH)
 
         # 2. Initialize Database Session
         # NOTE: DBRole.ADMIN and DBEnvironment.DEV/QA/PROD must be correctly configured
         logger.info("Initializing DEV database session...")
         session_maker = init_session(DBEnvironment.DEV, DBRole.ADMIN)
 
-        # 3. Execute the Ingestion Pipeline
+        # 3. Execute the Streaming Ingestion Pipeline
+        # The CSV is read in chunks inside ingest_long_csv, so the full file
+        # is never materialized in memory.
         with managed_session(session_maker) as session:
-            ingest_long_dataframe(
-                df=long_df, 
+            ingest_long_csv(
+                csv_path=DATA_FILE_PATH,
                 session=session,
                 patient_id_col=PATIENT_ID_COL,
                 field_name_col=FIELD_NAME_COL,